@@ -1,21 +1,65 @@
+import asyncio
+import hashlib
+import os
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, AnyUrl
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+import orjson
+from pydantic import BaseModel, AnyUrl, PositiveInt, field_validator
+from sqlalchemy import case, event, func, insert, lambda_stmt, select, update, Column, Integer, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, relationship
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
 
 # -----------------------------
 # DB
 # -----------------------------
-DATABASE_URL = "sqlite:///./links.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
-Base = declarative_base()
+DATABASE_URL = "sqlite+aiosqlite:///./links.db"
+# WAL allows many readers next to the single writer, so keep a pool of warm
+# connections (each with its own hot page cache) instead of one per request.
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=20,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    # The routes reuse the same handful of select() shapes; keep their
+    # compiled SQL cached across requests.
+    query_cache_size=500,
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    # WAL lets readers run alongside the writer; NORMAL sync is safe with WAL
+    # and skips the fsync on every commit.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MiB
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB memory-mapped reads
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+# expire_on_commit=False: attributes stay readable after commit without an
+# implicit (and, under asyncio, forbidden) lazy reload.
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+class Base(DeclarativeBase):
+    pass
 
 
 class Section(Base):
@@ -28,7 +72,15 @@ class Section(Base):
     # Keep it (doesn't affect reorder). If your DB doesn't have it yet, delete links.db once.
     color = Column(String, default="slate", nullable=False)
 
-    links = relationship("Link", cascade="all, delete", passive_deletes=True)
+    # raise_on_sql: an accidental per-section lazy load (the N+1 that
+    # /sections used to have) fails loudly instead of silently querying.
+    links = relationship(
+        "Link",
+        order_by="Link.sort_order",
+        lazy="raise_on_sql",
+        cascade="all, delete",
+        passive_deletes=True,
+    )
 
 
 class Link(Base):
@@ -41,19 +93,52 @@ class Link(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
-Base.metadata.create_all(engine)
+# Back the /sections LEFT JOIN: sections are walked in display order and each
+# section's links (and its MAX(sort_order) for appends) are found by an index
+# seek. SQLite still sorts each section's links in a small temp B-tree
+# (EXPLAIN QUERY PLAN: "USE TEMP B-TREE FOR RIGHT PART OF ORDER BY").
+INDEXES = (
+    Index("ix_sections_sort_name", Section.sort_order, Section.name),
+    Index("ix_links_section_sort_created", Link.section_id, Link.sort_order, Link.created_at),
+)
+
+
+def _create_schema(conn):
+    Base.metadata.create_all(conn)
+    # create_all only adds indexes together with their table; make sure
+    # databases created before these indexes existed get them too.
+    for index in INDEXES:
+        index.create(conn, checkfirst=True)
+
+
+async def init_db():
+    # One-time schema setup / upgrade, run before the server starts (see
+    # run.sh) rather than by every worker on startup.
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_schema)
+    await engine.dispose()
+
 
 # -----------------------------
 # FastAPI
 # -----------------------------
 app = FastAPI()
 
+
+# The bundled UI is served same-origin; this is for a frontend hosted elsewhere.
+FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:8000")
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # lock down later for cloud
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=[FRONTEND_ORIGIN],
+    allow_credentials=False,
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["content-type"],
+    max_age=86400,  # let browsers cache the preflight for a day
 )
+# The /sections JSON (and index.html) compress well; tiny {"ok": true}
+# bodies stay below minimum_size and go out as-is.
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
 
 # -----------------------------
 # Schemas
@@ -78,10 +163,18 @@ class LinkUpdate(BaseModel):
 
 
 class ReorderPayload(BaseModel):
-    ordered_ids: List[int]
+    ordered_ids: List[PositiveInt]
+
+    @field_validator("ordered_ids")
+    @classmethod
+    def no_duplicates(cls, v):
+        # Reject before touching the DB; a repeated id has no single position.
+        if len(frozenset(v)) != len(v):
+            raise ValueError("ordered_ids must not contain duplicates")
+        return v
 
 
-ALLOWED_COLORS = {
+ALLOWED_COLORS = frozenset({
     "slate", "gray",
     "blue", "navy", "indigo", "sky", "cyan",
     "teal", "mint",
@@ -91,201 +184,285 @@ ALLOWED_COLORS = {
     "pink",
     "purple",
     "coffee",
-}
-
+})
+_COLOR_ERR = f"Invalid color. Allowed: {sorted(ALLOWED_COLORS)}"
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
-def get_db():
-    return SessionLocal()
+async def get_db():
+    # The context manager closes the session (returning its connection to
+    # the pool) however the route exits, and rolls back anything left open.
+    async with SessionLocal() as db:
+        yield db
+
+
+# GET /sections is read-mostly: keep its serialized body until a write bumps
+# the version. Each worker process has its own copy, so the TTL also bounds
+# how long a worker can miss another worker's writes.
+SECTIONS_CACHE_TTL = 60  # seconds
+_cache = {"v": 0, "json": None, "etag": None, "expires": 0.0}
+
+
+def invalidate_sections_cache():
+    _cache["v"] += 1
+    _cache["json"] = None
+    _cache["etag"] = None
+
+
+# Built once. A single LEFT JOIN of plain column rows: no ORM instances are
+# constructed for this read-only listing. Rows arrive grouped by section, in
+# display order; ties on sort_order fall back to name / insertion order.
+# lambda_stmt caches the cache key by code location, so executions skip
+# walking the Select tree as well as compiling it.
+_SECTIONS_STMT = lambda_stmt(
+    lambda: select(Section.id, Section.name, Section.color, Link.id, Link.title, Link.url)
+    .outerjoin(Link, Link.section_id == Section.id)
+    .order_by(Section.sort_order, Section.name, Link.sort_order, Link.created_at)
+)
+
+
+def _next_sort(sort_col, *where):
+    # COALESCE(MAX(sort_order), -1) + 1 as a scalar subquery, for appending.
+    return select(func.coalesce(func.max(sort_col), -1) + 1).where(*where).scalar_subquery()
 
 
 # -----------------------------
 # Routes
 # -----------------------------
-@app.get("/sections")
-def list_sections():
-    db = get_db()
-    sections = db.query(Section).order_by(Section.sort_order).all()
-
+async def _load_sections(db: AsyncSession):
     result = []
-    for s in sections:
-        links = (
-            db.query(Link)
-            .filter(Link.section_id == s.id)
-            .order_by(Link.sort_order)
-            .all()
-        )
-        result.append(
-            {
-                "id": s.id,
-                "name": s.name,
-                "color": s.color,
-                "links": [{"id": l.id, "title": l.title, "url": l.url} for l in links],
-            }
-        )
-
-    db.close()
+    current_id = links = None
+    for sid, name, color, lid, title, url in await db.execute(_SECTIONS_STMT):
+        if sid != current_id:
+            current_id, links = sid, []
+            result.append({"id": sid, "name": name, "color": color, "links": links})
+        if lid is not None:  # a section without links yields one all-NULL link side
+            links.append({"id": lid, "title": title, "url": url})
     return result
 
 
+# response_model=None: the body is built from trusted rows (and usually cached
+# bytes), so never let FastAPI infer a model and re-validate it.
+@app.get("/sections", response_model=None)
+async def list_sections(request: Request, db: AsyncSession = Depends(get_db)):
+    if _cache["json"] is not None and time.monotonic() < _cache["expires"]:
+        payload, etag = _cache["json"], _cache["etag"]
+    else:
+        version = _cache["v"]
+        payload = orjson.dumps(await _load_sections(db))
+        # Content hash, so every worker hands out the same tag for the same list.
+        etag = f'"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+        # Don't store a body built from data a concurrent write has since changed.
+        if _cache["v"] == version:
+            _cache.update(json=payload, etag=etag, expires=time.monotonic() + SECTIONS_CACHE_TTL)
+
+    # no-cache: the UI re-fetches right after every edit, so browsers must
+    # revalidate each time; an unchanged list costs a bodiless 304.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
 @app.post("/sections")
-def create_section(data: SectionCreate):
+async def create_section(data: SectionCreate, db: AsyncSession = Depends(get_db)):
     name = data.name.strip()
     if not name:
         raise HTTPException(400, "Section name cannot be empty")
 
-    db = get_db()
-
-    exists = db.query(Section).filter(Section.name == name).first()
-    if exists:
-        db.close()
+    # One statement: the sort position (after the current last section) is a
+    # subquery, the new id and default color come back via RETURNING, and
+    # the UNIQUE constraint on name rejects duplicates without a pre-check.
+    stmt = (
+        insert(Section)
+        .values(name=name, sort_order=_next_sort(Section.sort_order))
+        .returning(Section.id, Section.color)
+    )
+    try:
+        new_id, color = (await db.execute(stmt)).one()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(409, "Section name already exists")
-
-    s = Section(name=name)
-    db.add(s)
-    db.commit()
-    db.refresh(s)
-    db.close()
-    return {"id": s.id, "name": s.name, "color": s.color}
+    invalidate_sections_cache()
+    return {"id": new_id, "name": name, "color": color}
 
 
 @app.put("/sections/{section_id}")
-def update_section(section_id: int, data: SectionUpdate):
-    db = get_db()
-    s = db.query(Section).get(section_id)
+async def update_section(section_id: int, data: SectionUpdate, db: AsyncSession = Depends(get_db)):
+    s = await db.get(Section, section_id)
     if not s:
-        db.close()
         raise HTTPException(404, "Section not found")
 
     if data.name is not None:
         new_name = data.name.strip()
         if not new_name:
-            db.close()
             raise HTTPException(400, "Section name cannot be empty")
 
-        exists = (
-            db.query(Section)
-            .filter(Section.name == new_name, Section.id != section_id)
-            .first()
-        )
-        if exists:
-            db.close()
-            raise HTTPException(409, "Section name already exists")
-
         s.name = new_name
 
     if data.color is not None:
         c = data.color.strip().lower()
         if c not in ALLOWED_COLORS:
-            db.close()
-            raise HTTPException(400, f"Invalid color. Allowed: {sorted(ALLOWED_COLORS)}")
+            raise HTTPException(400, _COLOR_ERR)
         s.color = c
 
-    db.commit()
-    db.close()
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(409, "Section name already exists")
+    invalidate_sections_cache()
     return {"ok": True}
 
 
 @app.delete("/sections/{section_id}")
-def delete_section(section_id: int):
-    db = get_db()
-    s = db.query(Section).get(section_id)
+async def delete_section(section_id: int, db: AsyncSession = Depends(get_db)):
+    s = await db.get(Section, section_id)
     if not s:
-        db.close()
         raise HTTPException(404, "Section not found")
 
-    db.delete(s)
-    db.commit()
-    db.close()
+    await db.delete(s)
+    await db.commit()
+    invalidate_sections_cache()
     return {"ok": True}
 
 
 @app.post("/sections/{section_id}/links")
-def add_link(section_id: int, data: LinkCreate):
+async def add_link(section_id: int, data: LinkCreate, db: AsyncSession = Depends(get_db)):
     title = data.title.strip()
     url = str(data.url).strip()
     if not title:
         raise HTTPException(400, "Title cannot be empty")
 
-    db = get_db()
-
-    s = db.query(Section).get(section_id)
-    if not s:
-        db.close()
+    # Same single-statement insert; with foreign_keys=ON an unknown
+    # section_id is the only way this INSERT can fail.
+    stmt = (
+        insert(Link)
+        .values(
+            section_id=section_id,
+            title=title,
+            url=url,
+            sort_order=_next_sort(Link.sort_order, Link.section_id == section_id),
+        )
+        .returning(Link.id)
+    )
+    try:
+        new_id = (await db.execute(stmt)).scalar_one()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(404, "Section not found")
-
-    l = Link(section_id=section_id, title=title, url=url)
-    db.add(l)
-    db.commit()
-    db.refresh(l)
-    db.close()
-    return {"id": l.id, "title": l.title, "url": l.url}
+    invalidate_sections_cache()
+    return {"id": new_id, "title": title, "url": url}
 
 
 @app.put("/links/{link_id}")
-def update_link(link_id: int, data: LinkUpdate):
-    db = get_db()
-    l = db.query(Link).get(link_id)
+async def update_link(link_id: int, data: LinkUpdate, db: AsyncSession = Depends(get_db)):
+    l = await db.get(Link, link_id)
     if not l:
-        db.close()
         raise HTTPException(404, "Link not found")
 
     if data.title is not None:
         t = data.title.strip()
         if not t:
-            db.close()
             raise HTTPException(400, "Title cannot be empty")
         l.title = t
 
     if data.url is not None:
         l.url = str(data.url).strip()
 
-    db.commit()
-    db.close()
+    await db.commit()
+    invalidate_sections_cache()
     return {"ok": True}
 
 
 @app.delete("/links/{link_id}")
-def delete_link(link_id: int):
-    db = get_db()
-    l = db.query(Link).get(link_id)
+async def delete_link(link_id: int, db: AsyncSession = Depends(get_db)):
+    l = await db.get(Link, link_id)
     if not l:
-        db.close()
         raise HTTPException(404, "Link not found")
 
-    db.delete(l)
-    db.commit()
-    db.close()
+    await db.delete(l)
+    await db.commit()
+    invalidate_sections_cache()
     return {"ok": True}
 
 
 # ✅ IMPORTANT FIX:
 # These routes do NOT collide with /sections/{section_id}
 @app.put("/sections-reorder")
-def reorder_sections(data: ReorderPayload):
-    db = get_db()
-    for idx, sid in enumerate(data.ordered_ids):
-        db.query(Section).filter(Section.id == sid).update({"sort_order": idx})
-    db.commit()
-    db.close()
+async def reorder_sections(data: ReorderPayload, db: AsyncSession = Depends(get_db)):
+    # One transaction: commits on success, rolls back on error.
+    async with db.begin():
+        # The bulk UPDATE expects every id to match a row, so drop unknown ones.
+        known = set(await db.scalars(select(Section.id).where(Section.id.in_(data.ordered_ids))))
+        mappings = [
+            {"id": sid, "sort_order": idx}
+            for idx, sid in enumerate(data.ordered_ids)
+            if sid in known
+        ]
+        if mappings:
+            await db.execute(update(Section), mappings)
+    invalidate_sections_cache()
     return {"ok": True}
 
 
 @app.put("/sections/{section_id}/links-reorder")
-def reorder_links(section_id: int, data: ReorderPayload):
-    db = get_db()
-    for idx, lid in enumerate(data.ordered_ids):
-        db.query(Link).filter(Link.id == lid, Link.section_id == section_id).update({"sort_order": idx})
-    db.commit()
-    db.close()
+async def reorder_links(section_id: int, data: ReorderPayload, db: AsyncSession = Depends(get_db)):
+    ids = data.ordered_ids
+    if ids:
+        async with db.begin():
+            # One UPDATE ... SET sort_order = CASE id ... END that also validates:
+            # every (distinct, see ReorderPayload) id must be a link of this
+            # section, or the rowcount falls short and the reorder is rolled back.
+            result = await db.execute(
+                update(Link)
+                .where(Link.section_id == section_id, Link.id.in_(ids))
+                .values(sort_order=case({lid: idx for idx, lid in enumerate(ids)}, value=Link.id))
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != len(ids):
+                raise HTTPException(400, "ordered_ids must be links of this section")
+    invalidate_sections_cache()
     return {"ok": True}
 
 
 # -----------------------------
 # Static frontend
 # -----------------------------
+# For production, let nginx/caddy serve STATIC_DIR directly so static bytes
+# never go through the Python process; this mount is the fallback.
 STATIC_DIR = Path(__file__).resolve().parent / "static"
-app.mount("/", StaticFiles(directory=str(STATIC_DIR), html=True), name="static")
+
+
+class HashedStaticFiles(StaticFiles):
+    # Content-hash ETags computed once at startup (restart after editing the
+    # files). A matching If-None-Match gets a 304 without opening the file.
+    def __init__(self, *, directory, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self._etag_cache = {
+            os.path.realpath(path): f'"{hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()}"'
+            for path in Path(directory).rglob("*")
+            if path.is_file()
+        }
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        etag = self._etag_cache.get(str(full_path))
+        if etag is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        headers = {"etag": etag}
+        if self.is_not_modified(Headers(headers), Headers(scope=scope)):
+            return NotModifiedResponse(Headers(headers))
+        return FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+
+
+app.mount("/", HashedStaticFiles(directory=str(STATIC_DIR), html=True), name="static")
+
+
+if __name__ == "__main__":
+    # python main.py  ->  create or upgrade the tables and indexes in links.db
+    asyncio.run(init_db())
@@ -0,0 +1,18 @@
+#!/usr/bin/env sh
+# uvloop (libuv event loop) and httptools (C HTTP parser) cut the per-request
+# framework overhead, which dominates these small CRUD handlers.
+#
+# SQLite in WAL mode is fine with several worker processes (each opens its own
+# engine), but every worker keeps its own GET /sections cache and only
+# invalidates it on its own writes; with WORKERS > 1 a list can lag another
+# worker's write by up to SECTIONS_CACHE_TTL. WORKERS therefore defaults to 1.
+set -e
+cd "$(dirname "$0")"
+# Schema setup runs once here, not in every worker.
+python main.py
+exec uvicorn main:app \
+    --host "${HOST:-127.0.0.1}" \
+    --port "${PORT:-8000}" \
+    --loop uvloop \
+    --http httptools \
+    --workers "${WORKERS:-1}"